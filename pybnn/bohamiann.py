@@ -1,18 +1,16 @@
+import contextlib
 import logging
 import time
 import typing
-from itertools import islice
 
 import numpy as np
 import torch
 import torch.nn as nn
-import torch.utils.data as data_utils
 from scipy.stats import norm
 
 from pybnn.base_model import BaseModel
 from pybnn.priors import weight_prior, log_variance_prior
 from pybnn.sampler import AdaptiveSGHMC, SGLD, SGHMC, PreconditionedSGLD
-from pybnn.util.infinite_dataloader import infinite_dataloader
 from pybnn.util.layers import AppendLayer
 from pybnn.util.normalization import zero_mean_unit_var_denormalization, zero_mean_unit_var_normalization
 
@@ -35,6 +33,26 @@ def get_default_network(input_dimensionality: int) -> torch.nn.Module:
     return Architecture(n_inputs=input_dimensionality)
 
 
+@contextlib.contextmanager
+def num_threads_limited_to(num_threads: typing.Optional[int]):
+    """
+    Temporarily sets the number of threads torch uses for intra-op parallelism.
+    The setting is process-global and therefore affects all threads that run torch in the meantime.
+
+    :param num_threads: number of threads, None keeps the current setting
+    """
+    if num_threads is None:
+        yield
+        return
+
+    previous_num_threads = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous_num_threads)
+
+
 def nll(input: torch.Tensor, target: torch.Tensor):
     """
     computes the average negative log-likelihood (Gaussian)
@@ -43,20 +61,12 @@ def nll(input: torch.Tensor, target: torch.Tensor):
     :param target: target values
     :return: negative log-likelihood
     """
-    batch_size = input.size(0)
-
-    prediction_mean = input[:, 0].view((-1, 1))
-    log_prediction_variance = input[:, 1].view((-1, 1))
-    prediction_variance_inverse = 1. / (torch.exp(log_prediction_variance) + 1e-16)
-
-    mean_squared_error = (target.view(-1, 1) - prediction_mean) ** 2
+    prediction_mean, log_prediction_variance = input.unbind(dim=1)
 
-    log_likelihood = torch.sum(
-        torch.sum(-mean_squared_error * (0.5 * prediction_variance_inverse) - 0.5 * log_prediction_variance, dim=1))
+    error = target.reshape(-1) - prediction_mean
 
-    log_likelihood = log_likelihood / batch_size
-
-    return -log_likelihood
+    # multiplying with exp(-log_var) replaces the division by the variance
+    return 0.5 * (error * error * torch.exp(-log_prediction_variance) + log_prediction_variance).mean()
 
 
 class Bohamiann(BaseModel):
@@ -69,6 +79,10 @@ class Bohamiann(BaseModel):
                  metrics=(nn.MSELoss,),
                  likelihood_function=nll,
                  print_every_n_steps=100,
+                 device: typing.Optional[str] = None,
+                 compile_network: bool = False,
+                 use_mixed_precision: bool = False,
+                 num_threads: typing.Optional[int] = None,
                  ) -> None:
         """
 
@@ -94,6 +108,16 @@ class Bohamiann(BaseModel):
         :param metrics: metrics to evaluate
         :param likelihood_function: function handle that computes the training loss
         :param print_every_n_steps: defines after how many the current loss is printed
+        :param device: torch device on which the network is trained and evaluated,
+        defaults to `cuda` if available and `cpu` otherwise
+        :param compile_network: defines whether the forward pass and the likelihood function
+        of the sampling loop are compiled with `torch.compile`
+        :param use_mixed_precision: defines whether the forward pass of the sampling loop runs under
+        bfloat16 autocast, only has an effect if use_double_precision is False
+        :param num_threads: number of threads torch uses for the sampling loop on the cpu,
+        small networks with small batches may run faster with fewer threads.
+        If None the global setting of torch is used. Note that `torch.set_num_threads` is process-global,
+        i.e. it also affects other threads that run torch while `train` is running.
         """
         self.print_every_n_steps = print_every_n_steps
         self.metrics = metrics
@@ -103,9 +127,46 @@ class Bohamiann(BaseModel):
         self.is_trained = False
         self.use_double_precision = use_double_precision
         self.sampling_method = sampling_method
-        self.sampled_weights = []  # type: typing.List[typing.Tuple[np.ndarray]]
+        # weight samples stored parameter-wise, i.e. one tensor of shape [S, *parameter.shape] per parameter
+        self.sampled_params = {}  # type: typing.Dict[str, torch.Tensor]
+        self.num_samples = 0
         self.likelihood_function = likelihood_function
         self.sampler = None
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
+        self.compile_network = compile_network
+        self.use_mixed_precision = use_mixed_precision
+        self.num_threads = num_threads
+
+    @property
+    def sampled_weights(self) -> typing.List[typing.Tuple[np.ndarray]]:
+        """
+        Weight samples in the format of `self.network_weights`, i.e. one tuple of `np.ndarray` per sample.
+        Note that every access copies all samples from `self.sampled_params` to the host.
+
+        :return: List containing the sampled network weights
+        """
+        samples = [
+            samples[:self.num_samples].detach().to("cpu", copy=True).numpy()
+            for samples in self.sampled_params.values()
+        ]
+        return [tuple(s[i] for s in samples) for i in range(self.num_samples)]
+
+    @sampled_weights.setter
+    def sampled_weights(self, weights: typing.List[typing.Tuple[np.ndarray]]) -> None:
+        """
+        Replaces all weight samples, e.g. to restore previously saved samples.
+
+        :param weights: List of weight samples in the format of `self.network_weights`.
+        """
+        self.sampled_params = {}
+        for i, (name, parameter) in enumerate(self.model.named_parameters()):
+            samples = parameter.detach().new_empty((len(weights),) + parameter.shape)
+            for j, sample in enumerate(weights):
+                samples[j].copy_(torch.as_tensor(sample[i]))
+            self.sampled_params[name] = samples
+        self.num_samples = len(weights)
 
     @property
     def network_weights(self) -> tuple:
@@ -114,8 +175,10 @@ class Bohamiann(BaseModel):
 
         :return: Tuple containing current network weight values
         """
+        # copy=True guarantees a single copy that does not alias the parameter,
+        # independent of whether the network lives on the cpu or not
         return tuple(
-            np.asarray(parameter.data.clone().detach().numpy())
+            parameter.detach().to("cpu", copy=True).numpy()
             for parameter in self.model.parameters()
         )
 
@@ -129,8 +192,24 @@ class Bohamiann(BaseModel):
             the network parameters with the same index in `self.network_weights`.
         """
         logging.debug("Assigning new network weights")
-        for parameter, sample in zip(self.model.parameters(), weights):
-            parameter.copy_(torch.from_numpy(sample))
+        state_dict = {
+            name: torch.as_tensor(sample)
+            for (name, _), sample in zip(self.model.named_parameters(), weights)
+        }
+        self.model.load_state_dict(state_dict, strict=False)
+
+    def sampled_network_params(self, sample_index: int) -> typing.Dict[str, torch.Tensor]:
+        """
+        Weights of a single sample as parameters for `torch.func.functional_call`.
+
+        :param sample_index: specifies the index of the weight sample
+        :return: Dictionary mapping parameter names to views of the sampled weights
+        """
+        if not -self.num_samples <= sample_index < self.num_samples:
+            raise IndexError("Sample index {} is out of range for {} samples".format(sample_index, self.num_samples))
+
+        # slicing first excludes the preallocated storage of samples that have not been drawn (yet)
+        return {name: samples[:self.num_samples][sample_index] for name, samples in self.sampled_params.items()}
 
     def train(self, x_train: np.ndarray, y_train: np.ndarray,
               num_steps: int = 13000,
@@ -186,58 +265,47 @@ class Bohamiann(BaseModel):
         else:
             self.y = y_train
 
+        if self.use_double_precision:
+            dtype = np.float64
+        else:
+            dtype = np.float32
+
+        x_train_ = x_train
         if self.do_normalize_input:
             logging.debug(
                 "Normalizing training datapoints to "
                 " zero mean and unit variance."
             )
             x_train_, self.x_mean, self.x_std = self.normalize_input(x_train)
-            if self.use_double_precision:
-                x_train_ = torch.from_numpy(x_train_).double()
-            else:
-                x_train_ = torch.from_numpy(x_train_).float()
-        else:
-            if self.use_double_precision:
-                x_train_ = torch.from_numpy(x_train).double()
-            else:
-                x_train_ = torch.from_numpy(x_train).float()
 
         if self.do_normalize_output:
             logging.debug("Normalizing training labels to zero mean and unit variance.")
             y_train_, self.y_mean, self.y_std = self.normalize_output(self.y)
-
-            if self.use_double_precision:
-                y_train_ = torch.from_numpy(y_train_).double()
-            else:
-                y_train_ = torch.from_numpy(y_train_).float()
         else:
-            if self.use_double_precision:
-                y_train_ = torch.from_numpy(y_train).double()
-            else:
-                y_train_ = torch.from_numpy(y_train).float()
+            y_train_ = y_train
 
-        train_loader = infinite_dataloader(
-            data_utils.DataLoader(
-                data_utils.TensorDataset(x_train_, y_train_),
-                batch_size=batch_size,
-                shuffle=True
-            )
-        )
-
-        if self.use_double_precision:
-            dtype = np.float64
-        else:
-            dtype = np.float32
+        # the data is normalized in its own precision and cast to the precision of the network only once,
+        # torch.from_numpy then shares the memory of the cast arrays
+        x_train_ = torch.from_numpy(np.ascontiguousarray(x_train_, dtype=dtype)).to(self.device, non_blocking=True)
+        y_train_ = torch.from_numpy(np.ascontiguousarray(y_train_, dtype=dtype)).to(self.device, non_blocking=True)
 
         if not continue_training:
             logging.debug("Clearing list of sampled weights.")
 
-            self.sampled_weights.clear()
             if self.use_double_precision:
                 self.model = self.get_network(input_dimensionality=input_dimensionality).double()
             else:
                 self.model = self.get_network(input_dimensionality=input_dimensionality).float()
+            self.model.to(self.device)
+
+            self.sampled_params = {
+                name: parameter.detach().new_empty((0,) + parameter.shape)
+                for name, parameter in self.model.named_parameters()
+            }
+            self.num_samples = 0
 
+            # all parameters are passed as a single group, such that AdaptiveSGHMC
+            # can update them jointly with its torch._foreach_* implementation
             if self.sampling_method == "adaptive_sghmc":
                 self.sampler = AdaptiveSGHMC(self.model.parameters(),
                                              scale_grad=dtype(num_datapoints),
@@ -259,58 +327,107 @@ class Bohamiann(BaseModel):
                                      mdecay=dtype(mdecay),
                                      lr=dtype(lr))
 
-        batch_generator = islice(enumerate(train_loader), num_steps)
-
-        for step, (x_batch, y_batch) in batch_generator:
-            self.sampler.zero_grad()
-            loss = self.likelihood_function(input=self.model(x_batch), target=y_batch)
+        # preallocate the storage for all samples that are kept during this run. The buffers
+        # grow geometrically, so repeated calls with continue_training copy the kept samples
+        # only a logarithmic number of times.
+        num_new_samples = len(range(num_burn_in_steps + keep_every, num_steps, keep_every))
+        for name, samples in self.sampled_params.items():
+            capacity = samples.shape[0]
+            if capacity < self.num_samples + num_new_samples:
+                capacity = max(self.num_samples + num_new_samples, 2 * capacity)
+                buffer = samples.new_empty((capacity,) + samples.shape[1:])
+                buffer[:self.num_samples].copy_(samples[:self.num_samples])
+                self.sampled_params[name] = buffer
+
+        # the whole training set stays resident on the device, hence we draw the
+        # batches by indexing it directly instead of going through a DataLoader.
+        # The indices of all batches are drawn at once with a single call to the RNG.
+        if batch_size == num_datapoints:
+            # every batch contains all datapoints, as promised by the warning above
+            batch_indices = torch.arange(num_datapoints, device=self.device).expand(num_steps, -1)
+        else:
+            batch_indices = torch.randint(0, num_datapoints, (num_steps, batch_size), device=self.device)
+
+        def sampling_loss(forward, likelihood_function, idx):
+            x_batch, y_batch = x_train_[idx], y_train_[idx]
+            with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16,
+                                enabled=self.use_mixed_precision):
+                output = forward(x_batch)
+            # the likelihood and the priors are computed in the precision of the network,
+            # which keeps exp(-log_var) and the parameter updates of the sampler accurate
+            output = output.to(x_batch.dtype)
+            loss = likelihood_function(input=output, target=y_batch)
             # Add prior. Note the gradient is computed by: g_prior + N/n sum_i grad_theta_xi see Eq 4
             # in Welling and Whye The 2011. Because of that we divide here by N=num of datapoints since
             # in the sample we rescale the gradient by N again
-            loss -= log_variance_prior(self.model(x_batch)[:, 1].view((-1, 1))) / num_datapoints
+            loss -= log_variance_prior(output[:, 1].view((-1, 1))) / num_datapoints
             loss -= weight_prior(self.model.parameters(), dtype=dtype) / num_datapoints
-            loss.backward()
-            self.sampler.step()
+            return loss
+
+        # only the fixed-shape mini-batch computations are compiled, the full dataset
+        # evaluations below and the predictions keep using the eager network
+        forward = self.model
+        likelihood_function = self.likelihood_function
+        if self.compile_network:
+            mode = "reduce-overhead" if self.device.type == "cuda" else "default"
+            try:
+                compiled_forward = torch.compile(self.model, mode=mode)
+                compiled_likelihood_function = torch.compile(self.likelihood_function, mode=mode)
+                # torch.compile is lazy, hence compilation errors only surface on the first call
+                sampling_loss(compiled_forward, compiled_likelihood_function, batch_indices[0]).backward()
+                forward, likelihood_function = compiled_forward, compiled_likelihood_function
+            except Exception as e:
+                logging.warning("Compiling the network failed, falling back to eager mode: %s" % e)
+            self.sampler.zero_grad(set_to_none=True)
+
+        # the thread setting is restored after the sampling loop
+        num_threads = self.num_threads if self.device.type == "cpu" else None
+
+        with num_threads_limited_to(num_threads):
+            for step in range(num_steps):
+                self.sampler.zero_grad(set_to_none=True)
+                loss = sampling_loss(forward, likelihood_function, batch_indices[step])
+                loss.backward()
+                self.sampler.step()
+
+                if verbose and step > 0 and step % self.print_every_n_steps == 0:
+
+                    # compute the training performance of the ensemble
+                    if self.num_samples > 1:
+                        mu, var = self.predict(x_train)
+                    # in case we do not have an ensemble we compute the performance of the last weight sample
+                    else:
+                        # a single forward pass without autograd graph over the whole training set
+                        with torch.inference_mode():
+                            f = self.model(x_train_).cpu().numpy()
 
-            if verbose and step > 0 and step % self.print_every_n_steps == 0:
+                        mu = f[:, 0]
+                        var = np.exp(f[:, 1])
+                        if self.do_normalize_output:
+                            mu = zero_mean_unit_var_denormalization(mu, self.y_mean, self.y_std)
+                            var = var * self.y_std ** 2
 
-                # compute the training performance of the ensemble
-                if len(self.sampled_weights) > 1:
-                    mu, var = self.predict(x_train)
                     total_nll = -np.mean(norm.logpdf(y_train, loc=mu, scale=np.sqrt(var)))
                     total_mse = np.mean((y_train - mu) ** 2)
-                # in case we do not have an ensemble we compute the performance of the last weight sample
-                else:
-                    f = self.model(x_train_)
-
-                    if self.do_normalize_output:
-                        mu = zero_mean_unit_var_denormalization(f[:, 0], self.y_mean, self.y_std).data.numpy()
-                        var = torch.exp(f[:, 1]) * self.y_std ** 2
-                        var = var.data.numpy()
-                    else:
-                        mu = f[:, 0].data.numpy()
-                        var = np.exp(f[:, 1].data.numpy())
-                    total_nll = -np.mean(norm.logpdf(y_train, loc=mu, scale=np.sqrt(var)))
-                    total_mse = np.mean((y_train - mu) ** 2)
-
-                t = time.time() - start_time
 
-                if step < num_burn_in_steps:
-                    print("Step {:8d} : NLL = {:11.4e} MSE = {:.4e} "
-                          "Time = {:5.2f}".format(step, float(total_nll),
-                                                  float(total_mse), t))
+                    t = time.time() - start_time
 
-                if step > num_burn_in_steps:
-                    print("Step {:8d} : NLL = {:11.4e} MSE = {:.4e} "
-                          "Samples= {} Time = {:5.2f}".format(step,
-                                                              float(total_nll),
-                                                              float(total_mse),
-                                                              len(self.sampled_weights), t))
+                    if step < num_burn_in_steps:
+                        print("Step {:8d} : NLL = {:11.4e} MSE = {:.4e} "
+                              "Time = {:5.2f}".format(step, float(total_nll),
+                                                      float(total_mse), t))
 
-            if step > num_burn_in_steps and (step - num_burn_in_steps) % keep_every == 0:
-                weights = self.network_weights
+                    if step > num_burn_in_steps:
+                        print("Step {:8d} : NLL = {:11.4e} MSE = {:.4e} "
+                              "Samples= {} Time = {:5.2f}".format(step,
+                                                                  float(total_nll),
+                                                                  float(total_mse),
+                                                                  self.num_samples, t))
 
-                self.sampled_weights.append(weights)
+                if step > num_burn_in_steps and (step - num_burn_in_steps) % keep_every == 0:
+                    for name, parameter in self.model.named_parameters():
+                        self.sampled_params[name][self.num_samples].copy_(parameter.detach())
+                    self.num_samples += 1
 
         self.is_trained = True
 
@@ -404,32 +521,41 @@ class Bohamiann(BaseModel):
         """
         return zero_mean_unit_var_normalization(x, m, s)
 
-    def predict(self, x_test: np.ndarray, return_individual_predictions: bool = False):
+    def predict(self, x_test: np.ndarray, return_individual_predictions: bool = False,
+                chunk_size: typing.Optional[int] = 16):
         """
         Predicts mean and variance for the given test point
 
         :param x_test: test datapoint
         :param return_individual_predictions: if True also the predictions of the individual models are returned
+        :param chunk_size: number of sampled networks that are evaluated at once. This bounds the memory of the
+            intermediate activations. None evaluates all networks at once.
         :return: mean and variance
         """
+        if self.use_double_precision:
+            dtype = np.float64
+        else:
+            dtype = np.float32
+
         x_test_ = np.asarray(x_test)
 
         if self.do_normalize_input:
             x_test_, *_ = self.normalize_input(x_test_, self.x_mean, self.x_std)
 
-        def network_predict(x_test_, weights):
-            with torch.no_grad():
-                self.network_weights = weights
-                if self.use_double_precision:
-                    return self.model(torch.from_numpy(x_test_).double()).numpy()
-                else:
-                    return self.model(torch.from_numpy(x_test_).float()).numpy()
+        # the normalized inputs are cast to the network precision once in numpy,
+        # torch.from_numpy then shares the memory of the array
+        x = torch.from_numpy(np.ascontiguousarray(x_test_, dtype=dtype)).to(self.device)
+
+        # the parameter-wise stacked weight samples allow to evaluate the networks in batched
+        # forward passes of chunk_size networks each, this also leaves the weights of self.model untouched
+        sampled_params = {name: samples[:self.num_samples] for name, samples in self.sampled_params.items()}
+
+        def network_predict(params, x):
+            return torch.func.functional_call(self.model, params, (x,))
 
-        logging.debug("Predicting with %d networks." % len(self.sampled_weights))
-        network_outputs = np.array([
-            network_predict(x_test_, weights=weights)
-            for weights in self.sampled_weights
-        ])
+        logging.debug("Predicting with %d networks." % self.num_samples)
+        with torch.inference_mode():
+            network_outputs = torch.vmap(network_predict, in_dims=(0, None), chunk_size=chunk_size)(sampled_params, x).cpu().numpy()
 
         mean_prediction = np.mean(network_outputs[:, :, 0], axis=0)
         # variance_prediction = np.mean((network_outputs[:, :, 0] - mean_prediction) ** 2, axis=0)
@@ -444,10 +570,10 @@ class Bohamiann(BaseModel):
             )
             variance_prediction *= self.y_std ** 2
 
-            for i in range(len(network_outputs)):
-                network_outputs[i] = zero_mean_unit_var_denormalization(
-                    network_outputs[i], self.y_mean, self.y_std
-                )
+            # only the means of the individual networks are returned, hence we denormalize all of them at once
+            network_outputs[:, :, 0] = zero_mean_unit_var_denormalization(
+                network_outputs[:, :, 0], self.y_mean, self.y_std
+            )
 
         if return_individual_predictions:
             return mean_prediction, variance_prediction, network_outputs[:, :, 0]
@@ -462,21 +588,23 @@ class Bohamiann(BaseModel):
         :param sample_index: specifies the index of the weight sample
         :return: mean and variance of the neural network
         """
+        if self.use_double_precision:
+            dtype = np.float64
+        else:
+            dtype = np.float32
+
         x_test_ = np.asarray(x_test)
 
         if self.do_normalize_input:
             x_test_, *_ = self.normalize_input(x_test_, self.x_mean, self.x_std)
 
-        def network_predict(x_test_, weights):
-            with torch.no_grad():
-                self.network_weights = weights
-                if self.use_double_precision:
-                    return self.model(torch.from_numpy(x_test_).double()).numpy()
-                else:
-                    return self.model(torch.from_numpy(x_test_).float()).numpy()
+        # the normalized inputs are cast to the network precision once in numpy,
+        # torch.from_numpy then shares the memory of the array
+        x = torch.from_numpy(np.ascontiguousarray(x_test_, dtype=dtype)).to(self.device)
 
-        logging.debug("Predicting with %d networks." % len(self.sampled_weights))
-        function_value = np.array(network_predict(x_test_, weights=self.sampled_weights[sample_index]))
+        with torch.inference_mode():
+            params = self.sampled_network_params(sample_index)
+            function_value = torch.func.functional_call(self.model, params, (x,)).cpu().numpy()
 
         if self.do_normalize_output:
             function_value = zero_mean_unit_var_denormalization(
@@ -487,13 +615,22 @@ class Bohamiann(BaseModel):
     def f_gradient(self, x_test, weights):
         x_test_ = np.asarray(x_test)
 
-        with torch.no_grad():
-            self.network_weights = weights
+        # weights are either given in the format of self.network_weights or
+        # as parameters returned by self.sampled_network_params
+        if isinstance(weights, dict):
+            params = weights
+        else:
+            params = {
+                name: torch.as_tensor(w).to(self.device)
+                for (name, _), w in zip(self.model.named_parameters(), weights)
+            }
 
         if self.use_double_precision:
-            x = torch.autograd.Variable(torch.from_numpy(x_test_[None, :]).double(), requires_grad=True)
+            x = torch.autograd.Variable(torch.from_numpy(x_test_[None, :]).double().to(self.device),
+                                        requires_grad=True)
         else:
-            x = torch.autograd.Variable(torch.from_numpy(x_test_[None, :]).float(), requires_grad=True)
+            x = torch.autograd.Variable(torch.from_numpy(x_test_[None, :]).float().to(self.device),
+                                        requires_grad=True)
 
         if self.do_normalize_input:
             if self.use_double_precision:
@@ -503,10 +640,10 @@ class Bohamiann(BaseModel):
                 x_mean = torch.autograd.Variable(torch.from_numpy(self.x_mean).float(), requires_grad=False)
                 x_std = torch.autograd.Variable(torch.from_numpy(self.x_std).float(), requires_grad=False)
 
-            x_norm = (x - x_mean) / x_std
-            m = self.model(x_norm)[0][0]
+            x_norm = (x - x_mean.to(self.device)) / x_std.to(self.device)
+            m = torch.func.functional_call(self.model, params, (x_norm,))[0][0]
         else:
-            m = self.model(x)[0][0]
+            m = torch.func.functional_call(self.model, params, (x,))[0][0]
         if self.do_normalize_output:
 
             if self.use_double_precision:
@@ -518,17 +655,29 @@ class Bohamiann(BaseModel):
                 y_mean = torch.autograd.Variable(torch.from_numpy(np.array([self.y_mean])).float(), requires_grad=False)
                 y_std = torch.autograd.Variable(torch.from_numpy(np.array([self.y_std])).float(), requires_grad=False)
 
-            m = m * y_std + y_mean
+            m = m * y_std.to(self.device) + y_mean.to(self.device)
 
         m.backward()
 
-        g = x.grad.data.numpy()[0, :]
+        g = x.grad.data.cpu().numpy()[0, :]
         return g
 
+    def sample_gradients(self, x_test: np.ndarray):
+        """
+        Computes the gradient of the mean prediction of every weight sample
+
+        :param x_test: test datapoint
+        :return: gradients with shape (num_samples, dimensionality of x_test)
+        """
+        grads = np.empty((self.num_samples, np.shape(x_test)[0]))
+        for i in range(self.num_samples):
+            grads[i] = self.f_gradient(x_test, weights=self.sampled_network_params(i))
+        return grads
+
     def predictive_mean_gradient(self, x_test: np.ndarray):
 
         # compute the individual gradients for each weight vector
-        grads = np.array([self.f_gradient(x_test, weights=weights) for weights in self.sampled_weights])
+        grads = self.sample_gradients(x_test)
 
         # the gradient of the mean is mean of all individual gradients
         g = np.mean(grads, axis=0)
@@ -538,10 +687,11 @@ class Bohamiann(BaseModel):
     def predictive_variance_gradient(self, x_test: np.ndarray):
         m, v, funcs = self.predict(x_test[None, :], return_individual_predictions=True)
 
-        grads = np.array([self.f_gradient(x_test, weights=weights) for weights in self.sampled_weights])
+        grads = self.sample_gradients(x_test)
 
-        dmdx = self.predictive_mean_gradient(x_test)
+        # the gradient of the mean is mean of all individual gradients
+        dmdx = np.mean(grads, axis=0)
 
-        g = np.mean([2 * (funcs[i] - m) * (grads[i] - dmdx) for i in range(len(self.sampled_weights))], axis=0)
+        g = np.mean(2 * (funcs - m) * (grads - dmdx), axis=0)
 
         return g
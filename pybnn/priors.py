@@ -19,6 +19,7 @@ def weight_prior(parameters: Iterable[torch.Tensor], dtype=np.float64, wdecay: f
     log_likelihood = torch.from_numpy(np.array(0, dtype=dtype))
     for parameter in parameters:
         num_parameters += parameter.numel()
-        log_likelihood += torch.sum(-wdecay * 0.5 * (parameter ** 2))
+        # out-of-place so that the accumulator follows the device of the parameters
+        log_likelihood = log_likelihood + torch.sum(-wdecay * 0.5 * (parameter ** 2))
 
     return log_likelihood / num_parameters
@@ -74,11 +74,14 @@ class AdaptiveSGHMC(Optimizer):
             loss = closure()
 
         for group in self.param_groups:
-            for parameter in group["params"]:
+            # all parameters of a group are updated at once with the torch._foreach_* ops,
+            # which replaces the per-parameter python loop by a few fused kernel launches
+            parameters = [parameter for parameter in group["params"] if parameter.grad is not None]
 
-                if parameter.grad is None:
-                    continue
+            if len(parameters) == 0:
+                continue
 
+            for parameter in parameters:
                 state = self.state[parameter]
 
                 if len(state) == 0:
@@ -89,36 +92,47 @@ class AdaptiveSGHMC(Optimizer):
                     state["momentum"] = torch.zeros_like(parameter)
                 state["iteration"] += 1
 
-                mdecay, epsilon, lr = group["mdecay"], group["epsilon"], group["lr"]
-                scale_grad = torch.tensor(group["scale_grad"], dtype=parameter.dtype)
-                tau, g, v_hat = state["tau"], state["g"], state["v_hat"]
+            mdecay, epsilon, lr = group["mdecay"], group["epsilon"], group["lr"]
+            states = [self.state[parameter] for parameter in parameters]
+            v_hat = [state["v_hat"] for state in states]
+            momentum = [state["momentum"] for state in states]
 
-                momentum = state["momentum"]
-                gradient = parameter.grad.data * scale_grad
+            gradient = torch._foreach_mul([parameter.grad for parameter in parameters], group["scale_grad"])
 
-                tau_inv = 1. / (tau + 1.)
+            # update parameters during burn-in
+            burn_in = [i for i, state in enumerate(states) if state["iteration"] <= group["num_burn_in_steps"]]
+            if len(burn_in) > 0:
+                tau_ = [states[i]["tau"] for i in burn_in]
+                g_ = [states[i]["g"] for i in burn_in]
+                v_hat_ = [v_hat[i] for i in burn_in]
+                gradient_ = [gradient[i] for i in burn_in]
 
-                # update parameters during burn-in
-                if state["iteration"] <= group["num_burn_in_steps"]:
-                    tau.add_(- tau * (
-                            g * g / (v_hat + epsilon)) + 1)  # specifies the moving average window, see Eq 9 in [1] left
-                    g.add_(-g * tau_inv + tau_inv * gradient)  # average gradient see Eq 9 in [1] right
-                    v_hat.add_(-v_hat * tau_inv + tau_inv * (gradient ** 2))  # gradient variance see Eq 8 in [1]
+                tau_inv = torch._foreach_reciprocal(torch._foreach_add(tau_, 1.))
 
-                minv_t = 1. / (torch.sqrt(v_hat) + epsilon)  # preconditioner
+                # specifies the moving average window, see Eq 9 in [1] left
+                window = torch._foreach_div(torch._foreach_mul(g_, g_), torch._foreach_add(v_hat_, epsilon))
+                torch._foreach_add_(tau_, torch._foreach_add(torch._foreach_mul(tau_, window), -1.), alpha=-1.)
+                # average gradient see Eq 9 in [1] right
+                torch._foreach_add_(g_, torch._foreach_mul(torch._foreach_sub(gradient_, g_), tau_inv))
+                # gradient variance see Eq 8 in [1]
+                torch._foreach_add_(v_hat_, torch._foreach_mul(
+                    torch._foreach_sub(torch._foreach_mul(gradient_, gradient_), v_hat_), tau_inv))
 
-                epsilon_var = (2. * (lr ** 2) * mdecay * minv_t - (lr ** 4))
+            # preconditioner
+            minv_t = torch._foreach_reciprocal(torch._foreach_add(torch._foreach_sqrt(v_hat), epsilon))
 
-                # sample random epsilon
-                sigma = torch.sqrt(torch.clamp(epsilon_var, min=1e-16))
-                sample_t = torch.normal(mean=torch.zeros_like(gradient), std=torch.ones_like(gradient) * sigma)
+            epsilon_var = torch._foreach_add(torch._foreach_mul(minv_t, 2. * (lr ** 2) * mdecay), -(lr ** 4))
 
-                # update momentum (Eq 10 right in [1])
-                momentum.add_(
-                    - (lr ** 2) * minv_t * gradient - mdecay * momentum + sample_t
-                )
+            # sample random epsilon
+            sigma = torch._foreach_sqrt(torch._foreach_clamp_min(epsilon_var, 1e-16))
+            sample_t = torch._foreach_mul([torch.randn_like(parameter) for parameter in parameters], sigma)
 
-                # update theta (Eq 10 left in [1])
-                parameter.data.add_(momentum)
+            # update momentum (Eq 10 right in [1])
+            torch._foreach_mul_(momentum, 1. - mdecay)
+            torch._foreach_add_(momentum, torch._foreach_mul(torch._foreach_mul(minv_t, gradient), -(lr ** 2)))
+            torch._foreach_add_(momentum, sample_t)
+
+            # update theta (Eq 10 left in [1])
+            torch._foreach_add_([parameter.data for parameter in parameters], momentum)
 
         return loss
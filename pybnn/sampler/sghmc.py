@@ -68,7 +68,7 @@ class SGHMC(Optimizer):
 
                 if len(state) == 0:
                     state["iteration"] = 0
-                    state["momentum"] = torch.randn(parameter.size(), dtype=parameter.dtype)
+                    state["momentum"] = torch.randn(parameter.size(), dtype=parameter.dtype, device=parameter.device)
 
                 state["iteration"] += 1
 
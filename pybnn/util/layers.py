@@ -11,4 +11,4 @@ class AppendLayer(nn.Module):
         nn.init.constant_(self.log_var, val=np.log(noise))
 
     def forward(self, x):
-        return torch.cat((x, self.log_var * torch.ones_like(x)), dim=1)
+        return torch.cat((x, self.log_var.expand_as(x)), dim=1)
@@ -18,12 +18,17 @@ def zero_one_denormalization(X_normalized, lower, upper):
 
 
 def zero_mean_unit_var_normalization(X, mean=None, std=None):
+    X = np.asarray(X)
+
     if mean is None:
         mean = np.mean(X, axis=0)
     if std is None:
         std = np.std(X, axis=0)
 
-    X_normalized = (X - mean) / std
+    # computes (X - mean) / std in place of a single output array, which avoids the temporary for X - mean
+    X_normalized = np.empty(np.shape(X), dtype=np.result_type(X, mean, std, 1.))
+    np.subtract(X, mean, out=X_normalized)
+    np.divide(X_normalized, std, out=X_normalized)
 
     return X_normalized, mean, std
 
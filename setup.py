@@ -10,8 +10,8 @@ setup(
     license='BSD 3-Clause License',
     classifiers=['Development Status :: 4 - Beta'],
     packages=find_packages(),
-    python_requires='>=3',
-    install_requires=['torch', 'torchvision', 'numpy', 'emcee', 'scipy'],
+    python_requires='>=3.8',
+    install_requires=['torch>=2.0', 'torchvision', 'numpy', 'emcee', 'scipy'],
     extras_require={},
     keywords=['python', 'Bayesian', 'neural networks'],
 )
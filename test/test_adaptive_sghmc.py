@@ -0,0 +1,76 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import torch
+
+from pybnn.sampler import AdaptiveSGHMC
+
+
+def reference_step(parameters, states, lr, num_burn_in_steps, epsilon, mdecay, scale_grad):
+    # per-parameter update of AdaptiveSGHMC without the injected noise
+    for parameter, state in zip(parameters, states):
+        state["iteration"] += 1
+        tau, g, v_hat, momentum = state["tau"], state["g"], state["v_hat"], state["momentum"]
+        gradient = parameter.grad * scale_grad
+
+        tau_inv = 1. / (tau + 1.)
+        if state["iteration"] <= num_burn_in_steps:
+            tau.add_(- tau * (g * g / (v_hat + epsilon)) + 1)
+            g.add_(-g * tau_inv + tau_inv * gradient)
+            v_hat.add_(-v_hat * tau_inv + tau_inv * (gradient ** 2))
+
+        minv_t = 1. / (torch.sqrt(v_hat) + epsilon)
+        momentum.add_(- (lr ** 2) * minv_t * gradient - mdecay * momentum)
+        parameter.data.add_(momentum)
+
+
+class TestAdaptiveSGHMC(unittest.TestCase):
+
+    def test_step_matches_reference(self):
+        hyperparameters = dict(lr=1e-2, num_burn_in_steps=5, epsilon=1e-10, mdecay=0.05, scale_grad=10.)
+
+        initial_values = [torch.randn(5, 3, dtype=torch.float64), torch.randn(4, dtype=torch.float64)]
+        gradients = [[torch.randn_like(value) for value in initial_values] for _ in range(10)]
+
+        parameters = [torch.nn.Parameter(value.clone()) for value in initial_values]
+        sampler = AdaptiveSGHMC(parameters, **hyperparameters)
+
+        reference_parameters = [torch.nn.Parameter(value.clone()) for value in initial_values]
+        reference_states = [dict(iteration=0, tau=torch.ones_like(value), g=torch.ones_like(value),
+                                 v_hat=torch.ones_like(value), momentum=torch.zeros_like(value))
+                            for value in initial_values]
+
+        with mock.patch("torch.randn_like", torch.zeros_like):
+            for step_gradients in gradients:
+                for parameter, reference_parameter, gradient in zip(parameters, reference_parameters,
+                                                                    step_gradients):
+                    parameter.grad = gradient.clone()
+                    reference_parameter.grad = gradient.clone()
+
+                sampler.step()
+                reference_step(reference_parameters, reference_states, **hyperparameters)
+
+        for parameter, reference_parameter, reference_state in zip(parameters, reference_parameters,
+                                                                   reference_states):
+            np.testing.assert_allclose(parameter.detach().numpy(), reference_parameter.detach().numpy(),
+                                       rtol=1e-12, atol=1e-14)
+            for key in ("tau", "g", "v_hat", "momentum"):
+                np.testing.assert_allclose(sampler.state[parameter][key].numpy(), reference_state[key].numpy(),
+                                           rtol=1e-12, atol=1e-14)
+
+    def test_skips_parameters_without_gradient(self):
+        parameters = [torch.nn.Parameter(torch.randn(3, dtype=torch.float64)),
+                      torch.nn.Parameter(torch.randn(3, dtype=torch.float64))]
+        value = parameters[1].detach().clone()
+        sampler = AdaptiveSGHMC(parameters)
+
+        parameters[0].grad = torch.randn(3, dtype=torch.float64)
+        sampler.step()
+
+        np.testing.assert_array_equal(parameters[1].detach().numpy(), value.numpy())
+        assert len(sampler.state[parameters[1]]) == 0
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
 import unittest
+from unittest import mock
 
 import numpy as np
+import torch
 from scipy.optimize import check_grad
+from scipy.stats import norm
 
-from pybnn.bohamiann import Bohamiann
+from pybnn.bohamiann import Bohamiann, nll
+from pybnn.sampler import AdaptiveSGHMC
 
 
 class TestBohamiann(unittest.TestCase):
@@ -24,6 +28,52 @@ class TestBohamiann(unittest.TestCase):
         assert len(v.shape) == 1
         assert v.shape[0] == X_test.shape[0]
 
+    def test_predict_chunk_size(self):
+        X_test = np.random.rand(10, self.X.shape[1])
+
+        m, v = self.model.predict(X_test, chunk_size=None)
+        for chunk_size in (1, 3):
+            m_chunked, v_chunked = self.model.predict(X_test, chunk_size=chunk_size)
+            np.testing.assert_allclose(m_chunked, m, rtol=1e-12)
+            np.testing.assert_allclose(v_chunked, v, rtol=1e-12)
+
+    def test_sampled_weights(self):
+        weights = self.model.sampled_weights
+        assert len(weights) == self.model.num_samples
+
+        # the returned samples do not alias the stored ones
+        weights[0][0][:] = 0
+        assert not np.all(self.model.sampled_weights[0][0] == 0)
+
+        X_test = np.random.rand(10, self.X.shape[1])
+        m, v = self.model.predict(X_test)
+
+        self.model.sampled_weights = self.model.sampled_weights[::-1]
+        assert len(self.model.sampled_weights) == len(weights)
+        np.testing.assert_array_equal(self.model.sampled_weights[0][1], weights[-1][1])
+
+        m_restored, v_restored = self.model.predict(X_test)
+        np.testing.assert_almost_equal(m_restored, m)
+        np.testing.assert_almost_equal(v_restored, v)
+
+    def test_sampled_network_params(self):
+        self.model.sampled_network_params(self.model.num_samples - 1)
+        self.model.sampled_network_params(-1)
+        with self.assertRaises(IndexError):
+            self.model.sampled_network_params(self.model.num_samples)
+
+    def test_continue_training(self):
+        weights = self.model.sampled_weights
+        for _ in range(3):
+            self.model.train(self.X, self.y, num_burn_in_steps=20, num_steps=100, keep_every=10,
+                             continue_training=True)
+
+        assert self.model.num_samples == 4 * len(weights)
+        assert len(self.model.sampled_weights) == self.model.num_samples
+        for sample, restored_sample in zip(weights, self.model.sampled_weights):
+            for w, restored_w in zip(sample, restored_sample):
+                np.testing.assert_array_equal(restored_w, w)
+
     def test_gradient_mean(self):
         X_test = np.random.rand(10, self.X.shape[1])
 
@@ -89,5 +139,107 @@ class TestBohamiannSampler(unittest.TestCase):
         self.model.train(self.X, self.y, num_burn_in_steps=20, num_steps=100, keep_every=10)
 
 
+class TestBohamiannOptions(unittest.TestCase):
+
+    def setUp(self):
+        self.X = np.random.rand(10, 3)
+        self.y = np.sinc(self.X * 10 - 5).sum(axis=1)
+
+    def test_device(self):
+        model = Bohamiann(device="cpu")
+        assert model.device == torch.device("cpu")
+        model.train(self.X, self.y, num_burn_in_steps=5, num_steps=20, keep_every=5)
+
+        assert all(p.device.type == "cpu" for p in model.model.parameters())
+        assert all(samples.device.type == "cpu" for samples in model.sampled_params.values())
+
+        m, v = model.predict(self.X)
+        assert isinstance(m, np.ndarray) and isinstance(v, np.ndarray)
+        assert np.all(np.isfinite(m))
+        assert np.all(np.isfinite(v))
+
+    def test_compile_network(self):
+        model = Bohamiann(compile_network=True)
+        model.train(self.X, self.y, num_burn_in_steps=5, num_steps=20, keep_every=5)
+
+        m, v = model.predict(self.X)
+        assert np.all(np.isfinite(m))
+        assert np.all(np.isfinite(v))
+
+    def test_compile_network_fallback(self):
+        def failing_compile(function, **kwargs):
+            def compiled(*args, **kwargs):
+                raise RuntimeError("compilation failed")
+            return compiled
+
+        model = Bohamiann(compile_network=True)
+        with mock.patch("torch.compile", failing_compile), self.assertLogs(level="WARNING") as logs:
+            model.train(self.X, self.y, num_burn_in_steps=5, num_steps=20, keep_every=5)
+        assert any("falling back to eager mode" in line for line in logs.output)
+
+        m, v = model.predict(self.X)
+        assert np.all(np.isfinite(m))
+        assert np.all(np.isfinite(v))
+
+    def test_mixed_precision(self):
+        model = Bohamiann(use_double_precision=False, use_mixed_precision=True)
+        model.train(self.X, self.y, num_burn_in_steps=5, num_steps=20, keep_every=5)
+
+        m, v = model.predict(self.X)
+        assert np.all(np.isfinite(m))
+        assert np.all(np.isfinite(v))
+
+    def test_num_threads(self):
+        num_threads = torch.get_num_threads()
+        torch.set_num_threads(2)
+        observed = []
+
+        def step(sampler, closure=None):
+            observed.append(torch.get_num_threads())
+
+        try:
+            model = Bohamiann(num_threads=1, device="cpu")
+            with mock.patch.object(AdaptiveSGHMC, "step", step):
+                model.train(self.X, self.y, num_burn_in_steps=5, num_steps=20, keep_every=5)
+
+            assert len(observed) == 20
+            assert all(n == 1 for n in observed)
+            # the previous setting is restored after training
+            assert torch.get_num_threads() == 2
+        finally:
+            torch.set_num_threads(num_threads)
+
+        assert Bohamiann().num_threads is None
+
+    def test_single_precision_large_offset(self):
+        # the spacing of float32 at 1e5 is ~8e-3, hence the inputs have to be normalized before the cast
+        X = 1e5 + np.random.rand(10, 1) * 1e-2
+        y = np.sin(600 * X[:, 0])
+        model = Bohamiann(use_double_precision=False)
+        model.train(X, y, num_burn_in_steps=5, num_steps=20, keep_every=5)
+
+        assert model.x_mean.dtype == np.float64
+
+        m, v = model.predict(X)
+        assert m.dtype == np.float64
+        assert len(np.unique(m)) == X.shape[0]
+        assert len(np.unique(model.predict_single(X, 0)[:, 0])) == X.shape[0]
+
+
+class TestNLL(unittest.TestCase):
+
+    def test_nll(self):
+        output = np.random.randn(20, 2)
+        target = np.random.randn(20)
+
+        loss = nll(torch.from_numpy(output), torch.from_numpy(target)).item()
+        # nll drops the constant 0.5 * log(2 pi) of the Gaussian log-likelihood
+        expected = -np.mean(norm.logpdf(target, loc=output[:, 0], scale=np.exp(0.5 * output[:, 1])))
+        np.testing.assert_almost_equal(loss, expected - 0.5 * np.log(2 * np.pi))
+
+        loss_2d = nll(torch.from_numpy(output), torch.from_numpy(target[:, None])).item()
+        np.testing.assert_almost_equal(loss_2d, loss)
+
+
 if __name__ == "__main__":
     unittest.main()
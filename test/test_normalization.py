@@ -38,6 +38,32 @@ class TestNormalization(unittest.TestCase):
         assert m.shape[0] == X.shape[1]
         assert s.shape[0] == X.shape[1]
 
+    def test_zero_mean_unit_var_normalization_matches_reference(self):
+        X = np.random.rand(100, 3)
+        # constant columns result in the same inf / nan values as the plain expression
+        X[:, 1] = 2.
+        X[:50, 2] = 0.
+        m = np.mean(X, axis=0)
+        s = np.std(X, axis=0)
+        s[2] = 0.
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            X_norm, _, _ = normalization.zero_mean_unit_var_normalization(X, m, s)
+            np.testing.assert_array_equal(X_norm, (X - m) / s)
+
+        X_32 = np.random.rand(100, 3).astype(np.float32)
+        X_norm, m_32, s_32 = normalization.zero_mean_unit_var_normalization(X_32)
+        assert X_norm.dtype == np.float32
+        np.testing.assert_array_equal(X_norm, (X_32 - m_32) / s_32)
+
+        y = np.random.rand(100)
+        y_norm, m, s = normalization.zero_mean_unit_var_normalization(y)
+        np.testing.assert_array_equal(y_norm, (y - m) / s)
+
+        X_list = [[1., 2.], [3., 5.], [4., 11.]]
+        X_norm, m, s = normalization.zero_mean_unit_var_normalization(X_list)
+        np.testing.assert_array_equal(X_norm, (np.asarray(X_list) - m) / s)
+
     def test_zero_one_unit_var_unnormalization(self):
         X_norm = np.random.randn(100, 3)
         m = np.ones(X_norm.shape[1]) * 3